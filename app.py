@@ -9,16 +9,16 @@ This creates the interactive web interface for the travel assistant.
 """
 
 import streamlit as st
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
 from datetime import datetime
 import asyncio
 import sys
+import html
+from collections import deque
+from itertools import islice
 
 # Import the agent
 try:
-    from main import TravelAgent, city_db
+    from main import TravelAgent
 except ImportError:
     st.error("⚠️ Could not import main.py. Make sure both files are in the same directory.")
     st.stop()
@@ -68,40 +68,101 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# ============================================================================
+# STATIC CONTENT
+# ============================================================================
+
+# Most recent queries kept in the session history
+MAX_HISTORY = 50
+
+# Built once at import so each rerun sends one delta per section
+_SIDEBAR_INTRO_MD = """
+### 🌍 AI Travel Assistant
+
+---
+
+#### 📋 Features
+
+- ✓ Intelligent routing (DB vs Web)
+- ✓ Real-time weather data
+- ✓ Beautiful image galleries
+- ✓ Interactive visualizations
+- ✓ Conversation memory
+
+---
+
+#### 🏙️ Pre-loaded Cities
+
+- **Paris** 🇫🇷
+- **Tokyo** 🇯🇵
+- **New York** 🇺🇸
+
+*Try other cities for web search!*
+
+---
+
+#### 💡 Try These
+"""
+
+_EXAMPLE_QUERIES = ("Paris", "Tokyo", "New York", "London", "Sydney")
+
+_FOOTER_HTML = """
+---
+
+<div style='text-align: center; color: #666; padding: 2rem;'>
+    <p>🤖 Powered by LangGraph + Streamlit + OpenAI</p>
+    <p>Built with ❤️ for AI Engineering Assignment</p>
+</div>
+"""
+
+# ============================================================================
+# SHARED RESOURCES
+# ============================================================================
+
+@st.cache_resource
+def get_agent():
+    """Build the travel agent once per process and share it across sessions"""
+    return TravelAgent()
+
 # ============================================================================
 # INITIALIZE SESSION STATE
 # ============================================================================
 
 if 'agent' not in st.session_state:
-    st.session_state.agent = TravelAgent()
+    st.session_state.agent = get_agent()
     
 if 'conversation_history' not in st.session_state:
-    st.session_state.conversation_history = []
+    st.session_state.conversation_history = deque(maxlen=MAX_HISTORY)
+
+# Total queries this session (the history only keeps the last MAX_HISTORY)
+if 'query_count' not in st.session_state:
+    st.session_state.query_count = 0
 
 if 'current_result' not in st.session_state:
     st.session_state.current_result = None
 
-if 'thread_id' not in st.session_state:
-    st.session_state.thread_id = f"user_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
+@st.cache_data(show_spinner=False)
 def create_weather_chart(weather_data):
     """Create interactive weather forecast chart using Plotly"""
     if not weather_data:
         return None
     
-    df = pd.DataFrame(weather_data)
+    import plotly.graph_objects as go
+    
+    days = [d['day'] for d in weather_data]
+    temps = [d['temperature'] for d in weather_data]
     
     # Create figure
     fig = go.Figure()
     
     # Add temperature line
-    fig.add_trace(go.Scatter(
-        x=df['day'],
-        y=df['temperature'],
+    fig.add_trace(go.Scattergl(
+        x=days,
+        y=temps,
         mode='lines+markers',
         name='Temperature',
         line=dict(color='#FF6B6B', width=3),
@@ -127,18 +188,31 @@ def create_weather_chart(weather_data):
     
     return fig
 
+@st.cache_data(show_spinner=False)
 def create_weather_table(weather_data):
-    """Create detailed weather table"""
+    """Create detailed weather table as a Plotly table trace"""
     if not weather_data:
         return None
     
-    df = pd.DataFrame(weather_data)
+    import plotly.graph_objects as go
+    
+    columns = ['day', 'temperature', 'condition', 'humidity', 'wind_speed']
+    headers = ['Day', 'Temp (°C)', 'Condition', 'Humidity (%)', 'Wind (km/h)']
     
-    # Format for display
-    display_df = df[['day', 'temperature', 'condition', 'humidity', 'wind_speed']].copy()
-    display_df.columns = ['Day', 'Temp (°C)', 'Condition', 'Humidity (%)', 'Wind (km/h)']
+    # Build cell columns straight from the forecast records
+    cells = [[d[c] for d in weather_data] for c in columns]
     
-    return display_df
+    fig = go.Figure(data=[go.Table(
+        header=dict(values=headers, fill_color='#e3f2fd', align='left'),
+        cells=dict(values=cells, align='left')
+    )])
+    
+    fig.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0),
+        height=40 + 30 * len(weather_data)
+    )
+    
+    return fig
 
 def display_image_gallery(image_urls):
     """Display images in a nice gallery layout"""
@@ -146,42 +220,73 @@ def display_image_gallery(image_urls):
         st.info("📸 No images available")
         return
     
-    st.write(f"Loading {len(image_urls)} images...")
-    
-    # Create columns for images
-    cols = st.columns(3)
-    
-    for idx, url in enumerate(image_urls[:6]):  # Limit to 6 images
-        with cols[idx % 3]:
-            try:
-                st.write(f"Image {idx + 1}:")
-                st.image(url, use_container_width=True)
-            except Exception as e:
-                st.error(f"Failed to load: {str(e)}")
-                # Fallback: Show colored box
-                st.markdown(f"""
-                <div style="
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    height: 200px;
-                    border-radius: 10px;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                    color: white;
-                    font-size: 24px;
-                ">
-                    📸 Photo {idx + 1}
-                </div>
-                """, unsafe_allow_html=True)
+    # One HTML grid instead of a widget per image; the browser fetches
+    # the images itself and defers off-screen ones
+    tiles = "".join(
+        f'<img loading="lazy" src="{html.escape(url)}" alt="Photo {idx + 1}" '
+        f'style="width:100%;border-radius:10px"/>'
+        for idx, url in enumerate(image_urls[:6])  # Limit to 6 images
+    )
+    
+    st.markdown(
+        f'<div style="display:grid;grid-template-columns:repeat(3,1fr);gap:1rem">{tiles}</div>',
+        unsafe_allow_html=True
+    )
+
+def render_weather_section(weather_data):
+    """Chart, quick stats and table for the forecast"""
+    # Create two columns
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        # Interactive chart
+        fig = create_weather_chart(weather_data)
+        if fig:
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.warning("Could not create weather chart")
+    
+    with col2:
+        # Weather stats
+        st.markdown("### 📊 Quick Stats")
+        
+        if weather_data:
+            temps = [d['temperature'] for d in weather_data]
+            avg_temp = sum(temps) / len(temps)
+            max_temp = max(temps)
+            min_temp = min(temps)
+            
+            st.metric("Average Temp", f"{avg_temp:.1f}°C")
+            st.metric("High", f"{max_temp}°C")
+            st.metric("Low", f"{min_temp}°C")
+    
+    # Detailed table
+    st.markdown("### 📋 Detailed Forecast")
+    weather_table = create_weather_table(weather_data)
+    if weather_table is not None:
+        st.plotly_chart(weather_table, use_container_width=True)
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _cached_process(city_key, _query):
+    """
+    Run the agent once per normalized city key (cached for an hour)
+    
+    _query is the user's original text; the underscore keeps it out of the
+    cache key. Errors are raised so they are never cached.
+    """
+    result = get_agent().process(_query)
+    if result.get("error"):
+        raise RuntimeError(result["error"])
+    return result
 
 def process_query(user_input):
     """Process user query through the agent"""
+    # Normalize so "Paris" and "paris " share one cache entry
+    city_key = user_input.strip().lower()
+    
     with st.spinner('🤔 AI Agent is thinking...'):
         try:
-            result = st.session_state.agent.process(
-                user_input, 
-                thread_id=st.session_state.thread_id
-            )
+            result = _cached_process(city_key, user_input.strip())
             return result
         except Exception as e:
             return {
@@ -197,54 +302,23 @@ def process_query(user_input):
 # ============================================================================
 
 with st.sidebar:
-    st.markdown("### 🌍 AI Travel Assistant")
-    st.markdown("---")
-    
-    st.markdown("#### 📋 Features")
-    st.markdown("""
-    - ✓ Intelligent routing (DB vs Web)
-    - ✓ Real-time weather data
-    - ✓ Beautiful image galleries
-    - ✓ Interactive visualizations
-    - ✓ Conversation memory
-    """)
+    st.markdown(_SIDEBAR_INTRO_MD)
     
-    st.markdown("---")
-    
-    st.markdown("#### 🏙️ Pre-loaded Cities")
-    st.markdown("""
-    - **Paris** 🇫🇷
-    - **Tokyo** 🇯🇵
-    - **New York** 🇺🇸
-    """)
-    
-    st.markdown("*Try other cities for web search!*")
-    
-    st.markdown("---")
-    
-    st.markdown("#### 💡 Try These")
-    example_queries = [
-        "Paris",
-        "Tokyo",
-        "New York",
-        "London",
-        "Sydney"
-    ]
-    
-    for query in example_queries:
+    for query in _EXAMPLE_QUERIES:
         if st.button(query, key=f"example_{query}"):
             st.session_state.example_query = query
     
     st.markdown("---")
     
     if st.button("🗑️ Clear History"):
-        st.session_state.conversation_history = []
+        st.session_state.conversation_history = deque(maxlen=MAX_HISTORY)
+        st.session_state.query_count = 0
         st.session_state.current_result = None
         st.rerun()
     
     st.markdown("---")
     st.markdown("#### 📊 Statistics")
-    st.metric("Queries", len(st.session_state.conversation_history))
+    st.metric("Queries", st.session_state.query_count)
 
 # ============================================================================
 # MAIN CONTENT
@@ -276,16 +350,29 @@ with col2:
 
 # Process query
 if explore_button and user_input:
+    # Stream the summary first so it shows right away; the agent reuses the
+    # generated text, so the model is only called once
+    summary_placeholder = st.empty()
+    with summary_placeholder.container():
+        st.write_stream(get_agent().stream_summary(user_input))
+    
     # Process the query
     result = process_query(user_input)
+    summary_placeholder.empty()
     
-    # Store in session state
+    # Store in session state (timestamps are formatted once, here).
+    # History keeps only a compact entry; the full result lives in current_result
+    now = datetime.now()
     st.session_state.current_result = result
+    fetched_ns = result.get("timestamp_ns")
+    fetched_at = datetime.fromtimestamp(fetched_ns / 1e9) if fetched_ns else now
+    st.session_state.last_updated = fetched_at.strftime("%Y-%m-%d %H:%M:%S")
     st.session_state.conversation_history.append({
         "query": user_input,
-        "result": result,
-        "timestamp": datetime.now()
+        "city": result.get("city", ""),
+        "timestamp_str": now.strftime("%H:%M:%S")
     })
+    st.session_state.query_count += 1
 
 # Display results
 if st.session_state.current_result:
@@ -302,9 +389,8 @@ if st.session_state.current_result:
         st.markdown("---")
         st.markdown("## 📝 City Information")
         
-        # Check routing decision
-        city = result.get("city", "Unknown")
-        if city_db.has_city(city):
+        # Check routing decision (made by the agent)
+        if result.get("route") == "database":
             st.success(f"✓ Retrieved from database (fast path)")
         else:
             st.info(f"🔍 Retrieved from web search")
@@ -322,53 +408,21 @@ if st.session_state.current_result:
         weather_data = result.get("weather_forecast", [])
         
         if weather_data:
-            # Create two columns
-            col1, col2 = st.columns([2, 1])
-            
-            with col1:
-                # Interactive chart
-                fig = create_weather_chart(weather_data)
-                if fig:
-                    st.plotly_chart(fig, use_container_width=True)
-                else:
-                    st.warning("Could not create weather chart")
-            
-            with col2:
-                # Weather stats
-                st.markdown("### 📊 Quick Stats")
-                
-                if weather_data:
-                    avg_temp = sum(d['temperature'] for d in weather_data) / len(weather_data)
-                    max_temp = max(d['temperature'] for d in weather_data)
-                    min_temp = min(d['temperature'] for d in weather_data)
-                    
-                    st.metric("Average Temp", f"{avg_temp:.1f}°C")
-                    st.metric("High", f"{max_temp}°C")
-                    st.metric("Low", f"{min_temp}°C")
-            
-            # Detailed table
-            st.markdown("### 📋 Detailed Forecast")
-            weather_table = create_weather_table(weather_data)
-            if weather_table is not None:
-                st.dataframe(weather_table, use_container_width=True, hide_index=True)
+            render_weather_section(weather_data)
         else:
             st.warning("No weather data available")
-         
-      # Image Gallery Section
-    st.markdown("---")
-    st.markdown("## 📸 Photo Gallery")
-
-    image_urls = result.get("image_urls", [])
-
-       # DEBUG: Show what we got
-    st.write(f"**Debug:** Got {len(image_urls)} image URLs")
-    st.write("**URLs:**", image_urls)
-
-    if image_urls:
-        st.write("Displaying images...")
-        display_image_gallery(image_urls)
-    else:
-        st.warning("No images available")
+        
+        # Image Gallery Section
+        st.markdown("---")
+        st.markdown("## 📸 Photo Gallery")
+        
+        image_urls = result.get("image_urls", [])
+        
+        if image_urls:
+            st.write("Displaying images...")
+            display_image_gallery(image_urls)
+        else:
+            st.warning("No images available")
         
         # Additional Info
         st.markdown("---")
@@ -384,7 +438,7 @@ if st.session_state.current_result:
         
         with info_col2:
             st.markdown("**Last Updated**")
-            st.markdown(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            st.markdown(st.session_state.get("last_updated", ""))
         
         with info_col3:
             st.markdown("**AI Model**")
@@ -396,35 +450,35 @@ if st.session_state.current_result:
 
 if st.session_state.conversation_history:
     with st.expander("📜 Conversation History", expanded=False):
-        for idx, conv in enumerate(reversed(st.session_state.conversation_history[-5:])):
-            st.markdown(f"**{idx + 1}. {conv['query']}** - {conv['timestamp'].strftime('%H:%M:%S')}")
+        for idx, conv in enumerate(islice(reversed(st.session_state.conversation_history), 5)):
+            st.markdown(f"**{idx + 1}. {conv['query']}** - {conv['timestamp_str']}")
 
 # ============================================================================
 # FOOTER
 # ============================================================================
 
-st.markdown("---")
-st.markdown("""
-<div style='text-align: center; color: #666; padding: 2rem;'>
-    <p>🤖 Powered by LangGraph + Streamlit + OpenAI</p>
-    <p>Built with ❤️ for AI Engineering Assignment</p>
-</div>
-""", unsafe_allow_html=True)
+st.markdown(_FOOTER_HTML, unsafe_allow_html=True)
 
 # ============================================================================
 # DEBUG INFO (Optional)
 # ============================================================================
 
-if st.checkbox("🔧 Show Debug Info", value=False):
+@st.fragment
+def render_debug_info():
+    """Debug panel (toggling it does not rerun the whole page)"""
+    if not st.checkbox("🔧 Show Debug Info", value=False):
+        return
+    
     st.markdown("### Debug Information")
     
     st.json({
-        "thread_id": st.session_state.thread_id,
-        "queries_count": len(st.session_state.conversation_history),
+        "queries_count": st.session_state.query_count,
         "current_result_available": st.session_state.current_result is not None,
         "agent_initialized": st.session_state.agent is not None
     })
     
     if st.session_state.current_result:
         st.markdown("### Current Result (Raw)")
-        st.json(st.session_state.current_result)
\ No newline at end of file
+        st.json(st.session_state.current_result)
+
+render_debug_info()
\ No newline at end of file
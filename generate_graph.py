@@ -152,6 +152,7 @@ def method4_matplotlib():
         import matplotlib.pyplot as plt
         import matplotlib.patches as mpatches
         from matplotlib.patches import FancyBboxPatch, FancyArrowPatch
+        from matplotlib.collections import PatchCollection
         
         fig, ax = plt.subplots(1, 1, figsize=(12, 10))
         ax.set_xlim(0, 10)
@@ -174,7 +175,8 @@ def method4_matplotlib():
             'Streamlit UI': (5, 1.5)
         }
         
-        # Draw nodes
+        # Draw nodes (boxes are batched into one PatchCollection)
+        boxes = []
         for name, (x, y) in nodes.items():
             if name == 'Check Database':
                 # Decision node (diamond shape)
@@ -200,10 +202,12 @@ def method4_matplotlib():
                                     boxstyle="round,pad=0.1",
                                     facecolor='#E8E8E8', 
                                     edgecolor='#666', linewidth=2)
-            ax.add_patch(box)
+            boxes.append(box)
             ax.text(x, y, name, ha='center', va='center', 
                    fontsize=10, fontweight='bold')
         
+        ax.add_collection(PatchCollection(boxes, match_original=True))
+        
         # Draw arrows
         arrows = [
             (nodes['User Input'], nodes['Extract City']),
@@ -216,6 +220,8 @@ def method4_matplotlib():
             (nodes['Combine Results'], nodes['Streamlit UI']),
         ]
         
+        # Arrows stay individual patches: FancyArrowPatch resolves its
+        # path at draw time, so it can't be batched into a collection
         for (x1, y1), (x2, y2) in arrows:
             arrow = FancyArrowPatch((x1, y1-0.35), (x2, y2+0.35),
                                    arrowstyle='->', mutation_scale=20,
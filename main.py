@@ -14,58 +14,94 @@ Author: AI Engineering Assignment
 """
 
 import os
+import sys
 import json
 import asyncio
-from typing import TypedDict, Annotated, Literal, Optional, List, Dict, Any
-from datetime import datetime, timedelta
-import operator
+import logging
+import threading
+import time
+import atexit
+import weakref
+from typing import TypedDict, Annotated, Literal, Optional, List, Dict, Any, Tuple
+from datetime import datetime, timedelta, timezone
+import httpx
+import numpy as np
+from functools import lru_cache
+from contextlib import asynccontextmanager, AsyncExitStack
+from collections import OrderedDict
 
 # LangGraph imports
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 
-# AI Model (using OpenAI - can switch to Anthropic)
+logger = logging.getLogger(__name__)
+
+# Event loops use uvloop when it's installed (not available on Windows)
 try:
-    from langchain_openai import ChatOpenAI
-    llm = ChatOpenAI(model="gpt-4o", temperature=0)
-except:
-    print("⚠️ OpenAI not configured. Using mock responses.")
-    llm = None
+    import uvloop
+    new_event_loop = uvloop.new_event_loop
+except ImportError:
+    new_event_loop = asyncio.new_event_loop
 
-# Vector Database
+# Fast JSON serialization (orjson if available, stdlib json otherwise)
 try:
-    import chromadb
-    from chromadb.config import Settings
-except:
-    chromadb = None
-    print("⚠️ ChromaDB not installed. Using simple dict database.")
+    import orjson
+    
+    def dumps_json(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    def dumps_json(obj: Any) -> str:
+        return json.dumps(obj)
+
+# AI Model (using OpenAI - can switch to Anthropic)
+# Created lazily so importing this module doesn't build the client
+@lru_cache(maxsize=1)
+def get_llm():
+    """Return the shared chat model, or None if OpenAI is not configured"""
+    try:
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model="gpt-4o", temperature=0)
+    except Exception as e:
+        logger.warning("OpenAI not configured (%s). Using mock responses.", e)
+        return None
 
 # ============================================================================
 # PART 1: STATE DEFINITION
 # ============================================================================
 
+# Messages kept per conversation thread
+MAX_THREAD_MESSAGES = 20
+
+def add_recent_messages(left: List, right: List) -> List:
+    """Append new messages, keeping only the most recent MAX_THREAD_MESSAGES"""
+    return (left + right)[-MAX_THREAD_MESSAGES:]
+
 class AgentState(TypedDict):
     """State that flows through the agent graph"""
     
     # User input
-    messages: Annotated[List, operator.add]
+    messages: Annotated[List, add_recent_messages]
     city: str
     
     # Routing decision
     route: Optional[str]  # "database" or "web"
+    _city_hit: Optional[Dict]  # database record found while routing
     
     # Fetched data
     city_summary: Optional[str]
     weather_forecast: Optional[List[Dict]]
-    image_urls: Optional[List[str]]
+    image_urls: Optional[Tuple[str, ...]]
+    
+    # Final structured output
+    structured_output: Optional[Dict]
     
     # Error handling
     error: Optional[str]
     
     # Memory for context
     last_city: Optional[str]
-    conversation_context: Optional[Dict]
 
 # ============================================================================
 # PART 2: VECTOR DATABASE SETUP
@@ -113,15 +149,40 @@ in the world.""",
                 "timezone": "EST (UTC-5)"
             }
         }
+        
+        self._keys = frozenset(self.cities)
+    
+    def _fuzzy_match(self, city_key: str) -> Optional[str]:
+        """
+        Return the key of a city the name is a typo of, if any
+        
+        Only one extra letter is forgiven ("pariss", "tokyoo"); anything
+        looser sends real places such as Paros to Paris.
+        """
+        for key in self._keys:
+            if len(city_key) == len(key) + 1 and any(
+                city_key[:i] + city_key[i + 1:] == key for i in range(len(city_key))
+            ):
+                return key
+        return None
+    
+    def lookup(self, city: str) -> Optional[Dict]:
+        """Normalize the name once and return the city record (None if unknown)"""
+        city_key = city.lower().strip()
+        if city_key in self._keys:
+            return self.cities[city_key]
+        
+        match = self._fuzzy_match(city_key)
+        return self.cities[match] if match else None
     
     def search(self, city: str) -> Optional[Dict]:
         """Search for city in database"""
-        city_lower = city.lower().strip()
-        return self.cities.get(city_lower)
+        return self.lookup(city)
     
     def has_city(self, city: str) -> bool:
         """Check if city exists in database"""
-        return city.lower().strip() in self.cities
+        city_key = city.lower().strip()
+        return city_key in self._keys or self._fuzzy_match(city_key) is not None
 
 # Initialize database
 city_db = CityDatabase()
@@ -130,42 +191,120 @@ city_db = CityDatabase()
 # PART 3: MOCK APIs (Can replace with real APIs)
 # ============================================================================
 
+_CONDITIONS = ("Sunny", "Cloudy", "Rainy", "Partly Cloudy", "Clear")
+
+# Forecasts are cached per city and calendar day
+_WEATHER_CACHE: Dict[tuple, List[Dict]] = {}
+_WEATHER_CACHE_MAX = 1024
+
+def _weather_cache_key(city: str, days: int = 5) -> tuple:
+    return (city.lower().strip(), days, datetime.now().date())
+
 def mock_weather_api(city: str, days: int = 5) -> List[Dict]:
     """
     Mock Weather API - Simulates OpenWeatherMap
     Replace with real API: https://openweathermap.org/api
     """
-    import random
-    base_temp = random.randint(15, 25)
+    key = _weather_cache_key(city, days)
+    cached = _WEATHER_CACHE.get(key)
+    if cached is not None:
+        # Copies, so callers can't change the cached forecast
+        return [dict(day) for day in cached]
     
-    forecast = []
-    conditions = ["Sunny", "Cloudy", "Rainy", "Partly Cloudy", "Clear"]
+    # Draw every random column in one vectorized call each
+    rng = np.random.default_rng()
+    base_temp = rng.integers(15, 26)
+    temps = (base_temp + rng.integers(-3, 4, days)).tolist()
+    conds = rng.choice(_CONDITIONS, days).tolist()
+    hums = rng.integers(40, 81, days).tolist()
+    winds = rng.integers(5, 21, days).tolist()
     
-    for i in range(days):
-        date = datetime.now() + timedelta(days=i)
-        temp = base_temp + random.randint(-3, 3)
-        
-        forecast.append({
-            "date": date.strftime("%Y-%m-%d"),
+    # The cache key already carries today's date; derive every day from it
+    today = key[2]
+    dates = [today + timedelta(days=i) for i in range(days)]
+    
+    forecast = [
+        {
+            "date": date.isoformat(),
             "day": date.strftime("%A"),
             "temperature": temp,
-            "condition": random.choice(conditions),
-            "humidity": random.randint(40, 80),
-            "wind_speed": random.randint(5, 20)
-        })
+            "condition": cond,
+            "humidity": hum,
+            "wind_speed": wind
+        }
+        for date, temp, cond, hum, wind in zip(dates, temps, conds, hums, winds)
+    ]
     
-    return forecast
+    if len(_WEATHER_CACHE) >= _WEATHER_CACHE_MAX:
+        _WEATHER_CACHE.clear()
+    _WEATHER_CACHE[key] = forecast
+    
+    return [dict(day) for day in forecast]
 
-def mock_image_api(city: str, count: int = 5) -> List[str]:
-    """Mock Image API - Reliable placeholders"""
-    colors = ["FF6B6B", "4ECDC4", "45B7D1", "FFA07A", "98D8C8"]
-    return [
-        f"https://via.placeholder.com/800x600/{colors[i % 5]}/FFFFFF?text={city.title()}+Photo+{i+1}"
+_IMG_COLORS = ("FF6B6B", "4ECDC4", "45B7D1", "FFA07A", "98D8C8")
+_IMG_TMPL = "https://via.placeholder.com/800x600/{c}/FFFFFF?text={city}+Photo+{i}"
+
+# Image URLs are cached per city
+_IMAGE_CACHE: Dict[tuple, Tuple[str, ...]] = {}
+_IMAGE_CACHE_MAX = 512
+
+def mock_image_api(city: str, count: int = 5) -> Tuple[str, ...]:
+    """Mock Image API - Reliable placeholders (cached, so returns a tuple)"""
+    key = (city, count)
+    cached = _IMAGE_CACHE.get(key)
+    if cached is not None:
+        return cached
+    
+    city_t = city.title()
+    image_urls = tuple(
+        _IMG_TMPL.format(c=_IMG_COLORS[i % len(_IMG_COLORS)], city=city_t, i=i + 1)
         for i in range(count)
-    ]
+    )
     
-    return base_urls[:count]
+    if len(_IMAGE_CACHE) >= _IMAGE_CACHE_MAX:
+        _IMAGE_CACHE.clear()
+    _IMAGE_CACHE[key] = image_urls
+    
+    return image_urls
+
+# Set SIMULATE_API_LATENCY=1 to make the mocks sleep like a real API call
+SIMULATE_API_LATENCY = bool(os.environ.get("SIMULATE_API_LATENCY"))
+
+# Real APIs, used by the async fetchers when their keys are set
+WEATHER_API_URL = "https://api.openweathermap.org/data/2.5/forecast"
+IMAGE_API_URL = "https://api.unsplash.com/search/photos"
 
+def parse_openweather_forecast(payload: Dict, days: int = 5) -> List[Dict]:
+    """
+    Collapse OpenWeatherMap's 3-hourly forecast into one entry per day
+    (the reading closest to noon), matching mock_weather_api's format
+    
+    Days and noon are in the city's own time (the payload's UTC offset),
+    not the server's.
+    """
+    offset = payload.get("city", {}).get("timezone", 0)
+    daily = {}
+    for item in payload.get("list", []):
+        ts = datetime.fromtimestamp(item["dt"] + offset, timezone.utc)
+        date = ts.strftime("%Y-%m-%d")
+        if date not in daily or abs(ts.hour - 12) < abs(daily[date][0].hour - 12):
+            daily[date] = (ts, item)
+    
+    forecast = []
+    for date in sorted(daily)[:days]:
+        ts, item = daily[date]
+        forecast.append({
+            "date": date,
+            "day": ts.strftime("%A"),
+            "temperature": round(item["main"]["temp"]),
+            "condition": item["weather"][0]["main"],
+            "humidity": item["main"]["humidity"],
+            "wind_speed": round(item["wind"]["speed"] * 3.6)  # m/s -> km/h
+        })
+    
+    return forecast
+
+@lru_cache(maxsize=1024)
 def mock_web_search(query: str) -> str:
     """
     Mock Web Search API - Simulates Tavily/DuckDuckGo
@@ -186,6 +325,21 @@ like Tavily, DuckDuckGo, or Google Custom Search to fetch actual current informa
 # PART 4: AGENT NODES (LangGraph Components)
 # ============================================================================
 
+# Leading phrases stripped from the query to get the city name
+_CITY_PREFIXES = ("tell me about ", "what about ")
+
+def extract_city_name(text: str) -> str:
+    """Strip common phrases from a query, leaving the city name"""
+    city = text.strip()
+    
+    # Remove common phrases (plain prefix checks, no regex needed)
+    lowered = city.casefold()
+    for prefix in _CITY_PREFIXES:
+        if lowered.startswith(prefix):
+            return city[len(prefix):].strip()
+    
+    return city
+
 def extract_city_node(state: AgentState) -> AgentState:
     """
     Node 1: Extract city name from user message
@@ -199,13 +353,7 @@ def extract_city_node(state: AgentState) -> AgentState:
     
     # Simple extraction (in production, use NER or LLM)
     if isinstance(last_message, HumanMessage):
-        city = last_message.content.strip()
-        # Remove common phrases
-        city = city.replace("Tell me about", "").replace("tell me about", "")
-        city = city.replace("What about", "").replace("what about", "")
-        city = city.strip()
-        
-        return {"city": city}
+        return {"city": extract_city_name(last_message.content)}
     
     return {"error": "Invalid message format"}
 
@@ -216,31 +364,108 @@ def check_database_node(state: AgentState) -> AgentState:
     """
     city = state.get("city", "")
     
-    if city_db.has_city(city):
-        print(f"✓ Found '{city}' in database")
-        return {"route": "database"}
+    # Keep the hit so get_from_database_node doesn't search again
+    hit = city_db.search(city)
+    
+    if hit:
+        logger.info("Found '%s' in database", city)
+        # Use the database name so a typo's weather and images match the summary
+        return {"route": "database", "_city_hit": hit, "city": hit["name"]}
     else:
-        print(f"✗ '{city}' not in database, will use web search")
-        return {"route": "web"}
+        logger.info("'%s' not in database, will use web search", city)
+        return {"route": "web", "_city_hit": None}
 
-def get_from_database_node(state: AgentState) -> AgentState:
-    """
-    Node 3A: Retrieve information from vector database
-    """
-    city = state.get("city", "")
-    city_info = city_db.search(city)
+# Rendered database summaries, one per known city
+_SUMMARY_CACHE: Dict[str, str] = {}
+
+def format_database_summary(city_info: Dict) -> str:
+    """Render a database record as the markdown city summary (cached per city)"""
+    name = city_info['name']
+    summary = _SUMMARY_CACHE.get(name)
     
-    if city_info:
-        summary = f"""## {city_info['name']}, {city_info['country']}
+    if summary is None:
+        summary = _SUMMARY_CACHE[name] = f"""## {name}, {city_info['country']}
 
 {city_info['summary']}
 
 **Population:** {city_info['population']}
 **Timezone:** {city_info['timezone']}
 """
+    
+    return summary
+
+def format_web_summary(city: str, search_result: str) -> str:
+    """Render a web search result as the markdown city summary"""
+    return f"""## {city}
+
+{search_result}
+
+*Information retrieved from web search*
+"""
+
+# LLM-written web summaries, per normalized city name
+_WEB_SUMMARY_CACHE: Dict[str, str] = {}
+_WEB_SUMMARY_CACHE_MAX = 1024
+
+def stream_web_summary(city: str):
+    """
+    Yield the web summary of a city in chunks as it is generated
+    
+    With an LLM configured its tokens are yielded as they arrive and the
+    finished text is cached, so the UI stream and the graph share one call.
+    Without an LLM, or if the call fails, the search result is used as is.
+    """
+    key = city.lower().strip()
+    cached = _WEB_SUMMARY_CACHE.get(key)
+    if cached is not None:
+        yield cached
+        return
+    
+    search_result = mock_web_search(city)
+    llm = get_llm()
+    
+    if llm is None:
+        yield format_web_summary(city, search_result)
+        return
+    
+    heading = f"## {city}\n\n"
+    chunks = [heading]
+    yield heading
+    
+    messages = [
+        SystemMessage(content="You are a travel assistant. Write a short, friendly "
+                              "overview of the city using only the search results provided."),
+        HumanMessage(content=f"City: {city}\n\nSearch results:\n{search_result}")
+    ]
+    try:
+        for chunk in llm.stream(messages):
+            chunks.append(chunk.content)
+            yield chunk.content
+    except Exception as e:
+        logger.warning("LLM summary failed for %s (%s). Using the search result.", city, e)
+        fallback = format_web_summary(city, search_result)[len(heading):]
+        yield fallback if len(chunks) == 1 else "\n\n" + fallback
+        return
+    
+    footer = "\n\n*Information retrieved from web search*\n"
+    chunks.append(footer)
+    yield footer
+    
+    if len(_WEB_SUMMARY_CACHE) >= _WEB_SUMMARY_CACHE_MAX:
+        _WEB_SUMMARY_CACHE.clear()
+    _WEB_SUMMARY_CACHE[key] = "".join(chunks)
+
+def get_from_database_node(state: AgentState) -> AgentState:
+    """
+    Node 3A: Retrieve information from vector database
+    """
+    city = state.get("city", "")
+    city_info = state.get("_city_hit") or city_db.search(city)
+    
+    if city_info:
+        summary = format_database_summary(city_info)
         return {
-            "city_summary": summary,
-            "messages": [AIMessage(content=f"Found information about {city_info['name']} in database")]
+            "city_summary": summary
         }
     
     return {"error": f"Database lookup failed for {city}"}
@@ -251,55 +476,77 @@ def web_search_node(state: AgentState) -> AgentState:
     """
     city = state.get("city", "")
     
-    # Simulate web search
-    search_result = mock_web_search(city)
-    
-    summary = f"""## {city}
-
-{search_result}
-
-*Information retrieved from web search*
-"""
+    # Simulated web search, summarized by the LLM when one is configured
+    # (reuses the text if the UI already streamed it)
+    summary = "".join(stream_web_summary(city))
     
     return {
-        "city_summary": summary,
-        "messages": [AIMessage(content=f"Searched web for information about {city}")]
+        "city_summary": summary
     }
 
-async def fetch_weather_async(city: str) -> List[Dict]:
+async def fetch_weather_async(city: str, client: Optional[httpx.AsyncClient] = None) -> List[Dict]:
     """Async weather fetching for parallel execution"""
-    # Simulate API latency
-    await asyncio.sleep(0.5)
-    return mock_weather_api(city)
+    api_key = os.environ.get("OPENWEATHER_API_KEY")
+    if client is None or not api_key:
+        # Simulate API latency on cache misses (opt-in)
+        if SIMULATE_API_LATENCY and _weather_cache_key(city) not in _WEATHER_CACHE:
+            await asyncio.sleep(0.5)
+        return mock_weather_api(city)
+    
+    response = await client.get(
+        WEATHER_API_URL,
+        params={"q": city, "units": "metric", "appid": api_key}
+    )
+    response.raise_for_status()
+    return parse_openweather_forecast(response.json())
 
-async def fetch_images_async(city: str) -> List[str]:
+async def fetch_images_async(city: str, client: Optional[httpx.AsyncClient] = None) -> Tuple[str, ...]:
     """Async image fetching for parallel execution"""
-    # Simulate API latency
-    await asyncio.sleep(0.5)
-    return mock_image_api(city)
+    api_key = os.environ.get("UNSPLASH_ACCESS_KEY")
+    if client is None or not api_key:
+        # Simulate API latency on cache misses (opt-in)
+        if SIMULATE_API_LATENCY and (city, 5) not in _IMAGE_CACHE:
+            await asyncio.sleep(0.5)
+        return mock_image_api(city)
+    
+    response = await client.get(
+        IMAGE_API_URL,
+        params={"query": city, "per_page": 5, "client_id": api_key}
+    )
+    response.raise_for_status()
+    return tuple(photo["urls"]["regular"] for photo in response.json().get("results", []))
 
-async def parallel_fetch_node(state: AgentState) -> AgentState:
+async def parallel_fetch_node(state: AgentState, config: RunnableConfig) -> AgentState:
     """
     Node 4: Fetch weather and images IN PARALLEL
     This demonstrates Distinction 2: Parallel Fan-Out
     """
     city = state.get("city", "")
     
-    print(f"⚡ Fetching weather and images in parallel for {city}...")
+    logger.info("Fetching weather and images in parallel for %s...", city)
     
-    # Run both API calls concurrently
-    weather_task = fetch_weather_async(city)
-    images_task = fetch_images_async(city)
+    # Both API calls share one HTTP client and run concurrently,
+    # so the node takes max(weather, images) rather than the sum.
+    # TravelAgent passes its pooled client; otherwise open a short-lived one,
+    # but only if a real API is configured (the mocks don't need one)
+    client = (config or {}).get("configurable", {}).get("http_client")
+    real_apis = os.environ.get("OPENWEATHER_API_KEY") or os.environ.get("UNSPLASH_ACCESS_KEY")
     
-    # Wait for both to complete
-    weather_data, image_urls = await asyncio.gather(weather_task, images_task)
+    if client is None and real_apis:
+        async with httpx.AsyncClient(timeout=10) as client:
+            weather_data, image_urls = await asyncio.gather(
+                fetch_weather_async(city, client), fetch_images_async(city, client)
+            )
+    else:
+        weather_data, image_urls = await asyncio.gather(
+            fetch_weather_async(city, client), fetch_images_async(city, client)
+        )
     
-    print(f"✓ Parallel fetch complete: {len(weather_data)} days, {len(image_urls)} images")
+    logger.info("Parallel fetch complete: %d days, %d images", len(weather_data), len(image_urls))
     
     return {
         "weather_forecast": weather_data,
-        "image_urls": image_urls,
-        "messages": [AIMessage(content=f"Fetched weather and images for {city}")]
+        "image_urls": image_urls
     }
 
 def combine_results_node(state: AgentState) -> AgentState:
@@ -315,14 +562,16 @@ def combine_results_node(state: AgentState) -> AgentState:
     # Create structured JSON output
     structured_output = {
         "city": city,
+        "route": state.get("route"),
         "city_summary": summary,
         "weather_forecast": weather,
         "image_urls": images,
-        "timestamp": datetime.now().isoformat()
+        "timestamp_ns": time.time_ns()  # formatted by the UI when shown
     }
     
+    # Only the new fields; the dict itself is the structured output
     return {
-        "messages": [AIMessage(content=json.dumps(structured_output, indent=2))],
+        "structured_output": structured_output,
         "last_city": city
     }
 
@@ -330,6 +579,13 @@ def combine_results_node(state: AgentState) -> AgentState:
 # PART 5: MANUAL TOOL EXECUTION (Distinction 1)
 # ============================================================================
 
+# Tool name -> handler(tool_args, state)
+_TOOL_HANDLERS = {
+    "get_weather": lambda args, state: mock_weather_api(args.get('city', state.get('city'))),
+    "search_images": lambda args, state: list(mock_image_api(args.get('city', state.get('city')))),
+    "web_search": lambda args, state: mock_web_search(args.get('query', '')),
+}
+
 def manual_tool_executor_node(state: AgentState) -> AgentState:
     """
     Advanced: Manual tool execution without framework wrappers
@@ -342,36 +598,29 @@ def manual_tool_executor_node(state: AgentState) -> AgentState:
     if not messages:
         return state
     
-    last_message = messages[-1]
-    
     # Check if LLM wants to call a tool
-    if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-        tool_call = last_message.tool_calls[0]
-        
-        tool_name = tool_call.get('name', '')
-        tool_args = tool_call.get('args', {})
-        
-        print(f"🔧 Manual tool execution: {tool_name}")
-        
-        # Execute tool manually
-        result = None
-        if tool_name == "get_weather":
-            city = tool_args.get('city', state.get('city'))
-            result = mock_weather_api(city)
-        elif tool_name == "search_images":
-            city = tool_args.get('city', state.get('city'))
-            result = mock_image_api(city)
-        elif tool_name == "web_search":
-            query = tool_args.get('query', '')
-            result = mock_web_search(query)
-        
-        # Create tool message manually
-        if result:
-            tool_message = ToolMessage(
-                content=json.dumps(result),
-                tool_call_id=tool_call.get('id', 'manual_tool_call')
-            )
-            return {"messages": [tool_message]}
+    tool_calls = getattr(messages[-1], 'tool_calls', None)
+    if not tool_calls:
+        return state
+    
+    tool_call = tool_calls[0]
+    
+    tool_name = tool_call.get('name', '')
+    tool_args = tool_call.get('args', {})
+    
+    logger.info("Manual tool execution: %s", tool_name)
+    
+    # Execute tool manually
+    handler = _TOOL_HANDLERS.get(tool_name)
+    result = handler(tool_args, state) if handler else None
+    
+    # Create tool message manually
+    if result:
+        tool_message = ToolMessage(
+            content=dumps_json(result),
+            tool_call_id=tool_call.get('id', 'manual_tool_call')
+        )
+        return {"messages": [tool_message]}
     
     return state
 
@@ -391,7 +640,8 @@ def route_based_on_check(state: AgentState) -> Literal["database", "web"]:
 # PART 7: BUILD THE GRAPH
 # ============================================================================
 
-def build_agent_graph():
+@lru_cache(maxsize=1)
+def build_workflow() -> StateGraph:
     """
     Build the LangGraph workflow
     This is the core architecture
@@ -434,52 +684,216 @@ def build_agent_graph():
     # End
     workflow.add_edge("combine_results", END)
     
+    return workflow
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    MemorySaver that only keeps the most recently used max_threads threads,
+    and only the latest checkpoint of each thread
+    """
+    
+    def __init__(self, max_threads: int = 256):
+        super().__init__()
+        self.max_threads = max_threads
+        self._recent_threads = OrderedDict()
+    
+    def put(self, config, checkpoint, metadata, new_versions):
+        result = super().put(config, checkpoint, metadata, new_versions)
+        
+        # Mark the thread as most recently used and evict the oldest ones
+        thread_id = config["configurable"]["thread_id"]
+        self._recent_threads[thread_id] = None
+        self._recent_threads.move_to_end(thread_id)
+        
+        while len(self._recent_threads) > self.max_threads:
+            oldest, _ = self._recent_threads.popitem(last=False)
+            self.delete_thread(oldest)
+        
+        self._drop_old_checkpoints(thread_id, config["configurable"].get("checkpoint_ns", ""), checkpoint)
+        
+        return result
+    
+    def _drop_old_checkpoints(self, thread_id, checkpoint_ns, checkpoint):
+        """Forget earlier checkpoints, writes and blobs of a thread"""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        for checkpoint_id in [c for c in checkpoints if c != checkpoint["id"]]:
+            del checkpoints[checkpoint_id]
+        
+        for key in [k for k in self.writes
+                    if k[0] == thread_id and k[1] == checkpoint_ns and k[2] != checkpoint["id"]]:
+            del self.writes[key]
+        
+        # Blobs still referenced by the latest checkpoint are kept
+        current = checkpoint["channel_versions"]
+        for key in [k for k in self.blobs
+                    if k[0] == thread_id and k[1] == checkpoint_ns and current.get(k[2]) != k[3]]:
+            del self.blobs[key]
+
+@lru_cache(maxsize=1)
+def _default_graph():
+    """The workflow compiled once with an in-memory checkpointer"""
+    return build_workflow().compile(checkpointer=BoundedMemorySaver())
+
+@lru_cache(maxsize=1)
+def _stateless_graph():
+    """The workflow compiled once without a checkpointer, for one-shot queries"""
+    return build_workflow().compile()
+
+def build_agent_graph(checkpointer=None):
+    """
+    Return the compiled agent graph
+    
+    Without a checkpointer this is a shared, compiled-once instance using
+    BoundedMemorySaver; passing one compiles the cached workflow against it.
+    """
     # Compile with memory (Distinction 3: Human-in-the-Loop)
-    memory = MemorySaver()
-    app = workflow.compile(checkpointer=memory)
+    if checkpointer is None:
+        return _default_graph()
+    return build_workflow().compile(checkpointer=checkpointer)
+
+# Checkpoints are stored on disk so conversations survive restarts
+# (next to this file, not the working directory). Only callers that pass a
+# thread_id use it; one-shot queries such as the Streamlit app's don't.
+CHECKPOINT_DB = os.environ.get(
+    "CHECKPOINT_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "checkpoints.db")
+)
+
+@asynccontextmanager
+async def open_checkpointer():
+    """Open the SQLite checkpoint store (yields None if the package is missing)"""
+    try:
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError:
+        AsyncSqliteSaver = None
     
-    return app
+    if AsyncSqliteSaver is None:
+        yield None
+        return
+    
+    os.makedirs(os.path.dirname(CHECKPOINT_DB) or ".", exist_ok=True)
+    async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB) as saver:
+        yield saver
+
+# Conversation threads kept in the SQLite store
+MAX_STORED_THREADS = 256
+
+async def prune_checkpoints(saver, max_threads: int = MAX_STORED_THREADS):
+    """
+    Keep the SQLite store bounded
+    
+    Only the latest checkpoint of each thread is kept, and only the
+    max_threads most recently updated threads (checkpoint ids are
+    time-ordered, so the largest id is the latest).
+    """
+    async with saver.lock:
+        await saver.conn.execute(
+            """DELETE FROM checkpoints WHERE checkpoint_id < (
+                   SELECT MAX(c.checkpoint_id) FROM checkpoints c
+                   WHERE c.thread_id = checkpoints.thread_id
+                     AND c.checkpoint_ns = checkpoints.checkpoint_ns)"""
+        )
+        await saver.conn.execute(
+            """DELETE FROM checkpoints WHERE thread_id IN (
+                   SELECT thread_id FROM checkpoints GROUP BY thread_id
+                   ORDER BY MAX(checkpoint_id) DESC LIMIT -1 OFFSET ?)""",
+            (max_threads,)
+        )
+        await saver.conn.execute(
+            """DELETE FROM writes WHERE NOT EXISTS (
+                   SELECT 1 FROM checkpoints c
+                   WHERE c.thread_id = writes.thread_id
+                     AND c.checkpoint_ns = writes.checkpoint_ns
+                     AND c.checkpoint_id = writes.checkpoint_id)"""
+        )
+        await saver.conn.commit()
 
 # ============================================================================
 # PART 8: AGENT INTERFACE
 # ============================================================================
 
+def _close_agent(agent_ref):
+    """atexit hook: close the agent if it is still alive"""
+    agent = agent_ref()
+    if agent is not None:
+        agent.close()
+
 class TravelAgent:
     """Main agent interface"""
     
     def __init__(self):
         self.graph = build_agent_graph()
+        
+        # One event loop for the agent's lifetime, run on a background thread
+        # so sync callers (Streamlit sessions) can share it concurrently
+        self._loop = new_event_loop()
+        self._loop_thread = threading.Thread(
+            target=self._loop.run_forever, name="travel-agent-loop", daemon=True
+        )
+        self._loop_thread.start()
+        
+        # Created lazily on the agent's loop, see _get_http_client
+        self._http_client = None
+        
+        # Opened lazily on the agent's loop, see _get_checkpointed_graph
+        self._checkpointer_stack = None
+        self._checkpointer = None
+        self._checkpointed_graph = None
+        self._checkpointer_lock = asyncio.Lock()
+        
+        # Close while the loop thread can still run (it is frozen by the
+        # time __del__ runs at interpreter shutdown)
+        atexit.register(_close_agent, weakref.ref(self))
     
-    async def process_async(self, user_input: str, thread_id: str = "default") -> Dict:
-        """Process user input through the agent graph"""
+    async def process_async(self, user_input: str, thread_id: Optional[str] = None) -> Dict:
+        """
+        Process user input through the agent graph
+        
+        Queries with a thread_id are checkpointed under that conversation;
+        without one the query runs once and nothing is stored.
+        """
         
         # Create initial state
         initial_state = {
             "messages": [HumanMessage(content=user_input)],
             "city": "",
             "route": None,
+            "_city_hit": None,
             "city_summary": None,
             "weather_forecast": None,
             "image_urls": None,
+            "structured_output": None,
             "error": None,
-            "last_city": None,
-            "conversation_context": {}
+            "last_city": None
         }
         
         # Run the graph
         config = {"configurable": {"thread_id": thread_id}}
         
+        # Reuse pooled connections when running on the agent's own loop
+        if asyncio.get_running_loop() is self._loop:
+            config["configurable"]["http_client"] = self._get_http_client()
+        
         try:
-            result = await self.graph.ainvoke(initial_state, config)
+            if thread_id is None:
+                result = await _stateless_graph().ainvoke(initial_state, config)
+            elif asyncio.get_running_loop() is self._loop:
+                graph, checkpointer = await self._get_checkpointed_graph()
+                result = await graph.ainvoke(initial_state, config)
+                if checkpointer:
+                    await prune_checkpoints(checkpointer)
+            else:
+                async with open_checkpointer() as checkpointer:
+                    # The async SQLite saver is bound to the running event loop,
+                    # so other loops open their own for the call
+                    graph = build_agent_graph(checkpointer) if checkpointer else self.graph
+                    result = await graph.ainvoke(initial_state, config)
+                    if checkpointer:
+                        await prune_checkpoints(checkpointer)
             
-            # Extract structured output from final message
-            if result.get("messages"):
-                last_message = result["messages"][-1]
-                if isinstance(last_message, AIMessage):
-                    try:
-                        return json.loads(last_message.content)
-                    except:
-                        pass
+            # Structured output is on the state
+            if result.get("structured_output"):
+                return result["structured_output"]
             
             # Fallback to state fields
             return {
@@ -499,9 +913,87 @@ class TravelAgent:
                 "image_urls": []
             }
     
-    def process(self, user_input: str, thread_id: str = "default") -> Dict:
+    def process(self, user_input: str, thread_id: Optional[str] = None) -> Dict:
         """Synchronous wrapper"""
-        return asyncio.run(self.process_async(user_input, thread_id))
+        future = asyncio.run_coroutine_threadsafe(
+            self.process_async(user_input, thread_id), self._loop
+        )
+        return future.result()
+    
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """HTTP client kept for the agent's lifetime so API calls reuse connections"""
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                timeout=10,
+                limits=httpx.Limits(max_connections=20, keepalive_expiry=300)
+            )
+        return self._http_client
+    
+    async def _get_checkpointed_graph(self):
+        """Open the SQLite store once on the agent's loop and compile the graph against it"""
+        async with self._checkpointer_lock:
+            if self._checkpointed_graph is None:
+                stack = AsyncExitStack()
+                checkpointer = await stack.enter_async_context(open_checkpointer())
+                self._checkpointer_stack = stack
+                self._checkpointer = checkpointer
+                self._checkpointed_graph = build_agent_graph(checkpointer) if checkpointer else self.graph
+        return self._checkpointed_graph, self._checkpointer
+    
+    async def aclose(self):
+        """Close the pooled HTTP client and the checkpoint store"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        
+        if self._checkpointer_stack is not None:
+            await self._checkpointer_stack.aclose()
+            self._checkpointer_stack = None
+            self._checkpointer = None
+            self._checkpointed_graph = None
+    
+    def close(self, timeout: float = 5.0):
+        """Stop and close the agent's event loop"""
+        if self._loop.is_closed() or threading.current_thread() is self._loop_thread:
+            return
+        
+        if self._loop_thread.is_alive():
+            future = asyncio.run_coroutine_threadsafe(self.aclose(), self._loop)
+            try:
+                future.result(timeout=timeout)
+            except Exception as e:
+                logger.warning("Could not close the agent cleanly (%s)", e)
+            
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join(timeout=timeout)
+        
+        if not self._loop.is_running():
+            self._loop.close()
+    
+    def __del__(self):
+        # Never block during interpreter shutdown; atexit has run close() already
+        if sys.is_finalizing():
+            return
+        try:
+            self.close()
+        except Exception:
+            pass
+    
+    def stream_summary(self, user_input: str):
+        """
+        Yield the city summary for a query in chunks as it is generated
+        
+        Known cities come straight from the database; other cities are
+        streamed by stream_web_summary. Run this before process() to show the
+        summary early: the graph then reuses the generated text.
+        """
+        city = extract_city_name(user_input)
+        city_info = city_db.search(city)
+        if city_info:
+            yield format_database_summary(city_info)
+            return
+        
+        yield from stream_web_summary(city)
 
 # ============================================================================
 # PART 9: GRAPH VISUALIZATION
@@ -533,6 +1025,8 @@ def save_graph_visualization():
 # ============================================================================
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    
     print("=" * 70)
     print("AI TRAVEL ASSISTANT - Agent Core")
     print("=" * 70)
@@ -546,10 +1040,18 @@ if __name__ == "__main__":
         "Snohomish"  # Not in database
     ]
     
-    for query in test_queries:
+    # Run all test queries concurrently (one thread per query so
+    # their checkpoints don't collide)
+    async def run_all():
+        return await asyncio.gather(
+            *(agent.process_async(q, thread_id=q) for q in test_queries)
+        )
+    
+    results = asyncio.run(run_all())
+    
+    for query, result in zip(test_queries, results):
         print(f"\n🔍 Testing: '{query}'")
         print("-" * 70)
-        result = agent.process(query)
         
         if result.get("error"):
             print(f"❌ Error: {result['error']}")
@@ -559,6 +1061,8 @@ if __name__ == "__main__":
             print(f"✓ Weather days: {len(result.get('weather_forecast', []))}")
             print(f"✓ Images: {len(result.get('image_urls', []))}")
     
+    agent.close()
+    
     print("\n" + "=" * 70)
     print("✓ Agent core is working!")
     print("Run 'streamlit run app.py' to see the UI")
@@ -0,0 +1,260 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+import main
+
+
+def _reading(ts, temp, condition="Clear", humidity=50, wind=2.5):
+    return {
+        "dt": int(ts.timestamp()),
+        "main": {"temp": temp, "humidity": humidity},
+        "weather": [{"main": condition}],
+        "wind": {"speed": wind},
+    }
+
+
+# Tokyo: readings are at local hours, far from the test machine's time
+TOKYO = timezone(timedelta(hours=9))
+
+
+def _forecast_payload():
+    readings = []
+    for day in (1, 2, 3):
+        for hour in (0, 9, 12, 15):
+            ts = datetime(2026, 6, day, hour, tzinfo=TOKYO)
+            readings.append(_reading(ts, temp=day * 10 + hour / 10))
+    return {"list": readings, "city": {"timezone": 9 * 3600}}
+
+
+def test_parse_openweather_forecast_picks_noon_reading():
+    forecast = main.parse_openweather_forecast(_forecast_payload())
+
+    assert [d["date"] for d in forecast] == ["2026-06-01", "2026-06-02", "2026-06-03"]
+    assert forecast[0] == {
+        "date": "2026-06-01",
+        "day": "Monday",
+        "temperature": 11,
+        "condition": "Clear",
+        "humidity": 50,
+        "wind_speed": 9,  # 2.5 m/s
+    }
+
+
+def test_parse_openweather_forecast_limits_days():
+    assert len(main.parse_openweather_forecast(_forecast_payload(), days=2)) == 2
+    assert main.parse_openweather_forecast({}) == []
+
+
+def _client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_fetch_weather_uses_api_when_key_is_set(monkeypatch):
+    monkeypatch.setenv("OPENWEATHER_API_KEY", "test-key")
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json=_forecast_payload())
+
+    async def run():
+        async with _client(handler) as client:
+            return await main.fetch_weather_async("Paris", client)
+
+    forecast = asyncio.run(run())
+
+    assert len(forecast) == 3
+    assert requests[0].url.params["q"] == "Paris"
+    assert requests[0].url.params["appid"] == "test-key"
+
+
+def test_fetch_images_uses_api_when_key_is_set(monkeypatch):
+    monkeypatch.setenv("UNSPLASH_ACCESS_KEY", "test-key")
+    payload = {"results": [{"urls": {"regular": f"https://img/{i}.jpg"}} for i in range(2)]}
+
+    async def run():
+        async with _client(lambda request: httpx.Response(200, json=payload)) as client:
+            return await main.fetch_images_async("Paris", client)
+
+    assert asyncio.run(run()) == ("https://img/0.jpg", "https://img/1.jpg")
+
+
+def test_fetch_raises_on_api_error(monkeypatch):
+    monkeypatch.setenv("OPENWEATHER_API_KEY", "test-key")
+
+    async def run():
+        async with _client(lambda request: httpx.Response(401)) as client:
+            return await main.fetch_weather_async("Paris", client)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(run())
+
+
+def test_parallel_fetch_without_keys_opens_no_client(monkeypatch):
+    monkeypatch.delenv("OPENWEATHER_API_KEY", raising=False)
+    monkeypatch.delenv("UNSPLASH_ACCESS_KEY", raising=False)
+
+    def no_client(*args, **kwargs):
+        raise AssertionError("mock mode should not create an HTTP client")
+
+    monkeypatch.setattr(main.httpx, "AsyncClient", no_client)
+
+    result = asyncio.run(main.parallel_fetch_node({"city": "Paris"}, {}))
+
+    assert len(result["weather_forecast"]) == 5
+    assert len(result["image_urls"]) == 5
+
+
+@pytest.mark.parametrize("query, name", [("Pariss", "Paris"), ("Tokyoo", "Tokyo"), ("NEW YORK ", "New York")])
+def test_city_lookup_matches_close_names(query, name):
+    assert main.city_db.lookup(query)["name"] == name
+
+
+@pytest.mark.parametrize("query", ["New Jersey", "York", "Kyoto", "Paros", "Parks", "Pari", "Snohomish", ""])
+def test_city_lookup_rejects_other_places(query):
+    assert main.city_db.lookup(query) is None
+    assert not main.city_db.has_city(query)
+
+
+def test_structured_output_includes_route():
+    agent = main.TravelAgent()
+    try:
+        typo = agent.process("Tell me about Pariss")
+        assert typo["route"] == "database"
+        assert typo["city"] == "Paris"
+        assert agent.process("Paros")["route"] == "web"
+    finally:
+        agent.close()
+
+
+def test_mock_weather_cache_is_not_shared_with_callers():
+    forecast = main.mock_weather_api("Lisbon")
+    forecast[0]["temperature"] = 999
+    forecast.clear()
+
+    again = main.mock_weather_api("Lisbon")
+    assert len(again) == 5
+    assert again[0]["temperature"] != 999
+
+
+class _FakeLLM:
+    def __init__(self, fail_after=None):
+        self.calls = 0
+        self.fail_after = fail_after
+
+    def stream(self, messages):
+        self.calls += 1
+        for i, word in enumerate(["Quiet ", "harbor ", "town."]):
+            if i == self.fail_after:
+                raise RuntimeError("rate limited")
+            yield type("Chunk", (), {"content": word})()
+
+
+def test_streamed_web_summary_is_reused_by_the_graph(monkeypatch):
+    llm = _FakeLLM()
+    monkeypatch.setattr(main, "get_llm", lambda: llm)
+    monkeypatch.setattr(main, "_WEB_SUMMARY_CACHE", {})
+    agent = main.TravelAgent()
+    try:
+        streamed = "".join(agent.stream_summary("Tell me about Snohomish"))
+        result = agent.process("Tell me about Snohomish")
+    finally:
+        agent.close()
+
+    assert streamed.startswith("## Snohomish\n\nQuiet harbor town.")
+    assert result["city_summary"] == streamed
+    assert llm.calls == 1
+
+
+@pytest.mark.parametrize("fail_after", [0, 2])
+def test_web_summary_falls_back_when_the_llm_fails(monkeypatch, fail_after):
+    llm = _FakeLLM(fail_after=fail_after)
+    monkeypatch.setattr(main, "get_llm", lambda: llm)
+    monkeypatch.setattr(main, "_WEB_SUMMARY_CACHE", {})
+
+    summary = "".join(main.stream_web_summary("Snohomish"))
+
+    assert summary.startswith("## Snohomish\n\n")
+    assert main.mock_web_search("Snohomish") in summary
+    assert main._WEB_SUMMARY_CACHE == {}
+
+
+def _initial_state(query):
+    return {"messages": [main.HumanMessage(content=query)], "city": "", "route": None,
+            "_city_hit": None, "city_summary": None, "weather_forecast": None,
+            "image_urls": None, "structured_output": None, "error": None, "last_city": None}
+
+
+def test_prune_checkpoints_keeps_latest_checkpoint_of_newest_threads(monkeypatch, tmp_path):
+    db = tmp_path / "checkpoints.db"
+    monkeypatch.setattr(main, "CHECKPOINT_DB", str(db))
+
+    async def run():
+        async with main.open_checkpointer() as saver:
+            graph = main.build_agent_graph(saver)
+            for thread in ("t1", "t2", "t3", "t4"):
+                for query in ("Paris", "Tokyo"):
+                    await graph.ainvoke(_initial_state(query), {"configurable": {"thread_id": thread}})
+            await main.prune_checkpoints(saver, max_threads=2)
+            state = await graph.aget_state({"configurable": {"thread_id": "t4"}})
+            return state.values
+
+    values = asyncio.run(run())
+
+    conn = sqlite3.connect(db)
+    try:
+        counts = dict(conn.execute("SELECT thread_id, COUNT(*) FROM checkpoints GROUP BY thread_id"))
+        orphans = conn.execute(
+            """SELECT COUNT(*) FROM writes w WHERE NOT EXISTS (
+                   SELECT 1 FROM checkpoints c WHERE c.thread_id = w.thread_id
+                   AND c.checkpoint_id = w.checkpoint_id)"""
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+    assert counts == {"t3": 1, "t4": 1}
+    assert orphans == 0
+    assert values["last_city"] == "Tokyo"
+    assert len(values["messages"]) == 2
+
+
+def test_bounded_memory_saver_evicts_threads_and_old_checkpoints():
+    saver = main.BoundedMemorySaver(max_threads=2)
+    graph = main.build_workflow().compile(checkpointer=saver)
+
+    async def run():
+        for thread in ("t1", "t2", "t3"):
+            for query in ("Paris", "Snohomish"):
+                await graph.ainvoke(_initial_state(query), {"configurable": {"thread_id": thread}})
+        # Resume a remaining thread
+        return await graph.ainvoke(_initial_state("Tokyo"), {"configurable": {"thread_id": "t3"}})
+
+    resumed = asyncio.run(run())
+
+    assert set(saver.storage) == {"t2", "t3"}
+    assert all(len(checkpoints) == 1 for ns in saver.storage.values() for checkpoints in ns.values())
+    assert {key[0] for key in saver.blobs} <= {"t2", "t3"}
+    assert [m.content for m in resumed["messages"]] == ["Paris", "Snohomish", "Tokyo"]
+    assert resumed["last_city"] == "Tokyo"
+
+
+def test_mock_images_only_wait_on_a_cache_miss(monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(main, "SIMULATE_API_LATENCY", True)
+    monkeypatch.setattr(main, "_IMAGE_CACHE", {})
+    monkeypatch.setattr(main.asyncio, "sleep", fake_sleep)
+
+    first = asyncio.run(main.fetch_images_async("Porto"))
+    second = asyncio.run(main.fetch_images_async("Porto"))
+
+    assert first == second
+    assert len(first) == 5
+    assert sleeps == [0.5]